@@ -1,10 +1,11 @@
-from google.cloud import bigquery
-from google.oauth2 import service_account
-import os 
-from dotenv import load_dotenv 
-from datetime import datetime, timezone, timedelta
+# Heavy dependencies (google-cloud, requests, aiohttp, diskcache) are
+# imported lazily inside the functions that need them, so short-lived
+# invocations that only use the pure helpers don't pay their import cost
+import os
+from dotenv import load_dotenv
 from functools import lru_cache
-import requests
+import asyncio
+import orjson
 import pandas as pd
 import numpy as np
 import time
@@ -13,56 +14,171 @@ load_dotenv ()
 
 PROJECT_ID = os.getenv("PROJECT_ID")
 
-def bigquery(query):
-    credentials = service_account.Credentials.from_service_account_file(filename='credentials/insights-credentials.json')
-    client = bigquery.Client(
-        credentials = credentials, 
+
+@lru_cache(maxsize=1)
+def _get_session():
+    """Builds a pooled HTTP session once so repeated calls reuse connections."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=0))
+    return session
+
+
+# Service account key used for BigQuery access
+_CREDENTIALS_PATH = 'credentials/insights-credentials.json'
+
+
+@lru_cache(maxsize=1)
+def _get_credentials():
+    """Reads and parses the service account key once; reused by every query."""
+    from google.oauth2 import service_account
+
+    try:
+        return service_account.Credentials.from_service_account_file(filename=_CREDENTIALS_PATH)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Service account key not found at '{_CREDENTIALS_PATH}'. "
+            "Place the BigQuery credentials file there before running queries."
+        ) from None
+
+
+@lru_cache(maxsize=1)
+def _get_client():
+    """Builds the BigQuery client once; later calls reuse the same connection."""
+    from google.cloud import bigquery
+
+    return bigquery.Client(
+        credentials = _get_credentials(),
         project = PROJECT_ID)
 
-    query_job = client.query(query)
-    rows = query_job.result() 
-    results = [dict(row) for row in rows]
-    return results
 
+def run_bigquery(query, as_records=False):
+    """
+    Runs a query and returns the results as a DataFrame.
+
+    Results stream back as columnar Arrow batches via the BigQuery Storage
+    API instead of going through a Python dict per row.
+
+    Args:
+        query: SQL query string
+        as_records: If True, return a list of dicts instead of a DataFrame
 
-def calculate_fee_rate(df):
+    Returns:
+        pandas.DataFrame (or list of dicts when as_records is True)
+    """
+    query_job = _get_client().query(query)
+    df = query_job.result().to_dataframe(create_bqstorage_client=True)
+
+    if as_records:
+        return df.to_dict(orient='records')
+    return df
+
+
+# Frames below this size aren't worth the Numba dispatch overhead
+_NUMBA_MIN_ROWS = 1_000_000
+
+@lru_cache(maxsize=1)
+def _get_fee_rate_kernel():
+    """Compiles the parallel fee_rate kernel once; None when numba is absent."""
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True, cache=True, error_model='numpy')
+    def _fee_rate_kernel(amount, fee):
+        """Fused, threaded fee_rate pass; mirrors the NumPy path exactly."""
+        n = amount.shape[0]
+        out = np.empty(n, dtype=np.float64)
+        for i in prange(n):
+            a = amount[i]
+            f = fee[i]
+            if a > 0.0:
+                r = f / a
+                # NaN or -inf collapses to inf, like the isfinite mask below
+                out[i] = r if r == r and r != -np.inf else np.inf
+            elif a == 0.0 and f == 0.0:
+                out[i] = 0.0
+            else:
+                out[i] = np.inf
+        return out
+
+    return _fee_rate_kernel
+
+
+def calculate_fee_rate(df, copy=False):
     """
     Calculate fee rates with proper handling of zero divisions and apply tolerance filtering.
-    
+
+    On multi-million-row frames the work runs through a parallel Numba
+    kernel (single fused pass, all cores) when numba is installed;
+    otherwise it falls back to the vectorized NumPy path.
+
     Parameters:
     df (pandas.DataFrame): DataFrame with 'fee' and 'amount' columns
-    tolerance_threshold (float): Maximum allowed fee rate (1.01 = 1% tolerance)
-    min_amount (float): Minimum amount to consider for fee rate calculation
-    
+    copy (bool): Copy the DataFrame instead of adding the column in place.
+        Default False, which avoids doubling memory on large frames.
+
     Returns:
     pandas.DataFrame: Cleaned DataFrame with fee_rate column
     """
-    
-    df = df.copy()
-    
-    # Handle different scenarios for fee rate calculation
-    conditions = [
-        (df['amount'] == 0) & (df['fee_computed'] == 0),   
-        (df['amount'] == 0) & (df['fee_computed'] > 0),
-        df['amount'] >= 0             
-    ]
-    
-    choices = [
-        0,                                      
-        np.inf,          
-        df['fee_computed'] / df['amount']                    
-    ]
-    
-    # Calculate fee rate using numpy select for vectorized conditions
-    df['fee_rate'] = np.select(conditions, choices, default=np.inf)
-    
-    # Replace any remaining NaN or inf values
-    df['fee_rate'] = df['fee_rate'].replace([np.inf, -np.inf, np.nan], np.inf)
-    
+
+    if copy:
+        df = df.copy()
+
+    # Pull each column out once as aligned, contiguous float64 so every
+    # pass below hits the SIMD fast path instead of re-reading the frame
+    amount = np.ascontiguousarray(df['amount'].to_numpy(), dtype=np.float64)
+    fee = np.ascontiguousarray(df['fee_computed'].to_numpy(), dtype=np.float64)
+
+    if amount.size >= _NUMBA_MIN_ROWS:
+        kernel = _get_fee_rate_kernel()
+        if kernel is not None:
+            df['fee_rate'] = kernel(amount, fee)
+            return df
+
+    # Start from inf (zero amount with a fee, negative amounts) and only
+    # divide where the amount is positive, so the zero/negative rows never
+    # hit the division at all
+    fee_rate = np.full(amount.shape, np.inf, dtype=np.float64)
+    np.divide(fee, amount, out=fee_rate, where=amount > 0)
+
+    # Zero amount and zero fee means no fee was charged
+    fee_rate[(amount == 0) & (fee == 0)] = 0.0
+
+    # Any remaining NaN or -inf from the division collapses to inf, in place
+    fee_rate[~np.isfinite(fee_rate)] = np.inf
+
+    df['fee_rate'] = fee_rate
+
     return df
 
-# Cache to store asset prices by asset_id (single avg price per asset)
-_price_cache = {}
+@lru_cache(maxsize=1)
+def _get_price_cache():
+    """
+    On-disk price cache keyed by (asset_id, start_unix, end_unix) so repeated
+    runs over the same date range skip the API entirely. Bounded with LRU
+    eviction so it can't grow without limit across many date windows.
+    """
+    import diskcache
+
+    return diskcache.Cache('.cache/prices', size_limit=32 * 1024 * 1024,
+                           eviction_policy='least-recently-used')
+
+# How long a fetched price stays valid, in seconds
+PRICE_CACHE_TTL = 86400
+
+# How long a failed lookup (dead asset, empty data, max retries) stays
+# cached before we retry it, in seconds
+NEGATIVE_PRICE_CACHE_TTL = 300
+
+# Sentinel to tell a cached None apart from a cache miss
+_CACHE_MISS = object()
+
+# Candle endpoint template, filled with (asset_id, start_unix, end_unix)
+_URL_TMPL = 'https://indexer.vestige.fi/assets/{}/candles?network_id=0&interval=86400&start={}&end={}&denominating_asset_id=0&volume_in_denominating_asset=false'
 
 # Supported asset IDs
 SUPPORTED_ASSETS = {
@@ -73,7 +189,26 @@ SUPPORTED_ASSETS = {
     'goeth': 386195940,     'compx': 1732165149,    'usdt': 312769,         'sparky': 3054226103
 }
 
-SUPPORTED_ASSET_IDS = set(SUPPORTED_ASSETS.values())
+SUPPORTED_ASSET_IDS = frozenset(SUPPORTED_ASSETS.values())
+
+# Sorted int64 array for vectorized membership tests over whole columns
+SUPPORTED_ASSET_IDS_ARR = np.fromiter(SUPPORTED_ASSETS.values(), dtype=np.int64)
+SUPPORTED_ASSET_IDS_ARR.sort()
+
+
+def is_supported_asset(asset_ids):
+    """
+    Vectorized membership test against the supported asset IDs.
+
+    Args:
+        asset_ids: Array or Series of asset IDs
+
+    Returns:
+        numpy.ndarray: Boolean mask, True where the ID is supported
+    """
+    return np.isin(np.asarray(asset_ids), SUPPORTED_ASSET_IDS_ARR)
+
+
 # Special case asset IDs
 ASSET_KEEP_NATIVE = 971381860  # Keep native amount
 ASSET_USE_USDC = 971384592     # Use USDC multiplier
@@ -81,6 +216,33 @@ WC_ASSETS = [127746157, 127745593, 127746786, 3145862805]
 ASSET_USE_USDC_SCALED = 849191641  # Use USDC * 0.01484306067
 USDC_SCALING_FACTOR = 0.01484306067
 
+def dates_to_unix_timestamps(start_dates, end_dates):
+    """
+    Converts arrays of start and end dates in YYYY-MM-DD format to Unix timestamps.
+
+    Vectorized over whole columns: the conversion happens as a single
+    C-level cast instead of one Python datetime object per row. End dates
+    are pushed to the last second of the day, matching date_to_unix_timestamp.
+
+    Args:
+        start_dates: Array or Series of start date strings in YYYY-MM-DD format.
+        end_dates: Array or Series of end date strings in YYYY-MM-DD format.
+
+    Returns:
+        A tuple of two int64 numpy arrays with the start and end Unix timestamps.
+    """
+    start = pd.to_datetime(start_dates, utc=True)
+    end = pd.to_datetime(end_dates, utc=True) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+
+    # Timedelta arithmetic instead of a raw int64 cast: the cast depends on
+    # the inferred resolution (ns vs us), which changed in pandas 3
+    epoch = pd.Timestamp(0, tz='utc')
+    start_timestamps = np.asarray((start - epoch) // pd.Timedelta(seconds=1), dtype=np.int64)
+    end_timestamps = np.asarray((end - epoch) // pd.Timedelta(seconds=1), dtype=np.int64)
+
+    return start_timestamps, end_timestamps
+
+
 def date_to_unix_timestamp(start_date_str, end_date_str):
     """
     Converts start and end dates in YYYY-MM-DD format to Unix timestamps.
@@ -92,36 +254,71 @@ def date_to_unix_timestamp(start_date_str, end_date_str):
     Returns:
         A tuple containing the start and end Unix timestamps.
     """
-    start_date = datetime.strptime(start_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-    end_date = datetime.strptime(end_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1) - timedelta(seconds=1)
+    start_timestamps, end_timestamps = dates_to_unix_timestamps([start_date_str], [end_date_str])
+    return int(start_timestamps[0]), int(end_timestamps[0])
+
+
+def _avg_close_price(data):
+    """
+    Averages the close prices of a candle response.
+
+    Builds a contiguous float64 array once and reduces it in C instead of
+    looping over a Python list.
+
+    Args:
+        data: Decoded candle list from the Vestige API
+
+    Returns:
+        float: Average close price, or None if no candles have a close
+    """
+    closes = np.fromiter(
+        (candle['close'] for candle in data if candle.get('close') is not None),
+        dtype=np.float64,
+    )
 
-    start_timestamp = int(start_date.timestamp())
-    end_timestamp = int(end_date.timestamp())
+    if closes.size == 0:
+        return None
 
-    return start_timestamp, end_timestamp
+    return float(closes.mean())
 
 
-def get_avg_close_price(asset_id, start_date, end_date, max_retries=3, base_delay=1):
+def get_avg_close_price(asset_id, start_unix, end_unix, max_retries=3, base_delay=1):
     """
     Fetches the average close price for an asset over a date range.
-    
+
+    Failed lookups are cached too (with a short TTL) so known-dead assets
+    don't get retried on every call.
+
     Args:
         asset_id: The asset ID
-        start_date: Start date in YYYY-MM-DD format
-        end_date: End date in YYYY-MM-DD format
+        start_unix: Start of the range as a Unix timestamp
+        end_unix: End of the range as a Unix timestamp
         max_retries: Maximum number of retry attempts
         base_delay: Base delay in seconds between retries (exponential backoff)
 
     Returns:
         float: Average close price over the period, or None if not available
     """
-    start_unix, end_unix = date_to_unix_timestamp(start_date, end_date)
+    cache_key = (asset_id, start_unix, end_unix)
+    cached = _get_price_cache().get(cache_key, default=_CACHE_MISS)
+    if cached is not _CACHE_MISS:
+        return cached
+
+    avg_price = _request_avg_close_price(asset_id, start_unix, end_unix, max_retries, base_delay)
+    ttl = PRICE_CACHE_TTL if avg_price is not None else NEGATIVE_PRICE_CACHE_TTL
+    _get_price_cache().set(cache_key, avg_price, expire=ttl)
+    return avg_price
 
-    price_feed = f'https://indexer.vestige.fi/assets/{asset_id}/candles?network_id=0&interval=86400&start={start_unix}&end={end_unix}&denominating_asset_id=0&volume_in_denominating_asset=false'
+
+def _request_avg_close_price(asset_id, start_unix, end_unix, max_retries=3, base_delay=1):
+    """Performs the actual Vestige request for get_avg_close_price, uncached."""
+    import requests
+
+    price_feed = _URL_TMPL.format(asset_id, start_unix, end_unix)
 
     for attempt in range(max_retries):
         try:
-            response = requests.get(price_feed, timeout=10)
+            response = _get_session().get(price_feed, timeout=10)
             
             if response.status_code == 429:
                 # Rate limited - exponential backoff
@@ -131,26 +328,19 @@ def get_avg_close_price(asset_id, start_date, end_date, max_retries=3, base_dela
                 continue
             
             response.raise_for_status()
-            data = response.json()
-            
+            data = orjson.loads(response.content)
+
             if not data or len(data) == 0:
                 return None
-            
-            # Calculate average close price
-            close_prices = [candle.get('close') for candle in data if candle.get('close') is not None]
-            
-            if not close_prices:
-                return None
-            
-            avg_price = sum(close_prices) / len(close_prices)
-            return avg_price
-        
+
+            return _avg_close_price(data)
+
         except requests.HTTPError as e:
             if response.status_code == 429 and attempt < max_retries - 1:
                 continue
             print(f"HTTP Error fetching price for asset {asset_id}: {e}")
             return None
-        except (requests.RequestException, KeyError, IndexError, TypeError) as e:
+        except (requests.RequestException, orjson.JSONDecodeError, KeyError, IndexError, TypeError) as e:
             print(f"Error fetching price for asset {asset_id}: {e}")
             return None
     
@@ -158,55 +348,215 @@ def get_avg_close_price(asset_id, start_date, end_date, max_retries=3, base_dela
     return None
 
 
-def get_cached_avg_price(asset_id):
+def get_cached_avg_price(asset_id, start_date, end_date):
     """
     Gets average close price for an asset, using cache to avoid duplicate API calls.
-    
+
     Args:
         asset_id: The asset ID
-    
+        start_date: Start date in YYYY-MM-DD format
+        end_date: End date in YYYY-MM-DD format
+
     Returns:
-        float: Average close price, or None if not available
+        float: Average close price, or None if not in cache (should be pre-populated)
     """
-    if asset_id in _price_cache:
-        return _price_cache[asset_id]
-    
-    return None  # Return None if not in cache (should be pre-populated)
+    start_unix, end_unix = date_to_unix_timestamp(start_date, end_date)
+    return _get_price_cache().get((asset_id, start_unix, end_unix))
+
+
+async def _fetch_price(session, limiter, asset_id, start_unix, end_unix, max_retries=3, base_delay=1):
+    """
+    Fetches the average close price for a single asset asynchronously.
+
+    Args:
+        session: Shared aiohttp.ClientSession
+        limiter: AsyncLimiter token bucket gating the request rate
+        asset_id: The asset ID
+        start_unix: Start of the range as a Unix timestamp
+        end_unix: End of the range as a Unix timestamp
+        max_retries: Maximum number of retry attempts
+        base_delay: Base delay in seconds between retries (exponential backoff)
+
+    Returns:
+        float: Average close price over the period, or None if not available
+    """
+    import aiohttp
+
+    price_feed = _URL_TMPL.format(asset_id, start_unix, end_unix)
+
+    for attempt in range(max_retries):
+        try:
+            async with limiter:
+                async with session.get(price_feed, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                    if response.status == 429:
+                        # Rate limited - honor Retry-After if the server sent
+                        # delta-seconds; HTTP-date or garbage falls back to
+                        # exponential backoff
+                        retry_after = response.headers.get('Retry-After', '')
+                        if retry_after.isdigit():
+                            wait_time = float(retry_after)
+                        else:
+                            wait_time = base_delay * (2 ** attempt)
+                        print(f"Rate limited for asset {asset_id}. Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
+                        await asyncio.sleep(wait_time)
+                        continue
+
+                    response.raise_for_status()
+                    data = orjson.loads(await response.read())
+
+            if not data or len(data) == 0:
+                return None
+
+            return _avg_close_price(data)
+
+        except aiohttp.ClientResponseError as e:
+            print(f"HTTP Error fetching price for asset {asset_id}: {e}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, orjson.JSONDecodeError, KeyError, IndexError, TypeError) as e:
+            print(f"Error fetching price for asset {asset_id}: {e}")
+            return None
+
+    print(f"Max retries exceeded for asset {asset_id}")
+    return None
+
+
+async def _fetch_prices(asset_ids, start_unix, end_unix, max_concurrency, requests_per_second):
+    """Fetches the given asset prices concurrently over one pooled session."""
+    import aiohttp
+    from aiolimiter import AsyncLimiter
+
+    # Token bucket: requests are admitted at the sustained rate the API
+    # allows instead of a fixed sleep between them
+    limiter = AsyncLimiter(requests_per_second, 1)
+    connector = aiohttp.TCPConnector(limit_per_host=max_concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = [
+            _fetch_price(session, limiter, asset_id, start_unix, end_unix)
+            for asset_id in asset_ids
+        ]
+        prices = await asyncio.gather(*tasks)
+
+    return dict(zip(asset_ids, prices))
 
 
-def fetch_all_supported_assets(start_date, end_date, delay_between_requests=0.5):
+def fetch_prices(asset_ids, start_date, end_date, max_concurrency=8, requests_per_second=8):
+    """
+    Fetches average prices for the given asset IDs as a single batch.
+
+    Vestige has no multi-asset candles endpoint, so the batch goes out as
+    concurrent requests multiplexed over one pooled session; cached assets
+    are skipped entirely. A token-bucket limiter paces the requests, and
+    429 responses honor the server's Retry-After header.
+
+    Args:
+        asset_ids: Iterable of asset IDs
+        start_date: Start date in YYYY-MM-DD format
+        end_date: End date in YYYY-MM-DD format
+        max_concurrency: Maximum number of in-flight requests
+        requests_per_second: Sustained request rate allowed by the limiter
+
+    Returns:
+        dict: Mapping of asset_id to average price (None where unavailable)
+    """
+    # Convert the date range once for the whole batch
+    start_unix, end_unix = date_to_unix_timestamp(start_date, end_date)
+
+    prices = {}
+    missing = []
+    for asset_id in asset_ids:
+        cached = _get_price_cache().get((asset_id, start_unix, end_unix), default=_CACHE_MISS)
+        if cached is not _CACHE_MISS:
+            prices[asset_id] = cached
+        else:
+            missing.append(asset_id)
+
+    if missing:
+        fetched = asyncio.run(_fetch_prices(missing, start_unix, end_unix, max_concurrency, requests_per_second))
+        for asset_id, avg_price in fetched.items():
+            prices[asset_id] = avg_price
+            ttl = PRICE_CACHE_TTL if avg_price is not None else NEGATIVE_PRICE_CACHE_TTL
+            _get_price_cache().set((asset_id, start_unix, end_unix), avg_price, expire=ttl)
+
+    return prices
+
+
+def fetch_all_supported_assets(start_date, end_date, max_concurrency=8):
     """
     Fetches average prices for all supported assets over the date range.
-    
+
+    Requests run concurrently (bounded by max_concurrency) instead of one
+    at a time, so the whole batch takes roughly one round-trip.
+
     Args:
         start_date: Start date in YYYY-MM-DD format
         end_date: End date in YYYY-MM-DD format
-        delay_between_requests: Delay in seconds between requests
-    
+        max_concurrency: Maximum number of in-flight requests
+
     Returns:
         dict: Mapping of asset_id to average price
     """
     print(f"Fetching average prices for {len(SUPPORTED_ASSETS)} assets from {start_date} to {end_date}...")
-    
-    for idx, (name, asset_id) in enumerate(SUPPORTED_ASSETS.items(), 1):
-        print(f"[{idx}/{len(SUPPORTED_ASSETS)}] Fetching {name} (ID: {asset_id})...")
-        
-        avg_price = get_avg_close_price(asset_id, start_date, end_date)
-        _price_cache[asset_id] = avg_price
-        
+
+    prices = fetch_prices(SUPPORTED_ASSETS.values(), start_date, end_date, max_concurrency)
+
+    for name, asset_id in SUPPORTED_ASSETS.items():
+        avg_price = prices[asset_id]
         if avg_price:
             print(f"{name}: {avg_price:.6f} ALGO")
         else:
             print(f"{name}: No data available")
-        
-        # Rate limiting
-        if idx < len(SUPPORTED_ASSETS):
-            time.sleep(delay_between_requests)
-    
-    print(f"\nFetched prices for {sum(1 for v in _price_cache.values() if v is not None)}/{len(SUPPORTED_ASSETS)} assets")
-    return _price_cache.copy()
+
+    print(f"\nFetched prices for {sum(1 for v in prices.values() if v is not None)}/{len(SUPPORTED_ASSETS)} assets")
+    return prices
+
+
+def build_price_lut(prices):
+    """
+    Builds a sorted lookup table from an {asset_id: avg_price} mapping.
+
+    Args:
+        prices: Mapping of asset_id to average price, e.g. the dict
+            returned by fetch_all_supported_assets (None values allowed)
+
+    Returns:
+        tuple: (sorted int64 asset ID array, matching float64 price array)
+    """
+    ids = np.fromiter(prices.keys(), dtype=np.int64)
+    values = np.fromiter((v if v is not None else np.nan for v in prices.values()), dtype=np.float64)
+
+    order = np.argsort(ids)
+    return ids[order], values[order]
+
+
+def lookup_prices(asset_ids, lut):
+    """
+    Maps a column of asset IDs to prices through a build_price_lut table.
+
+    A single searchsorted gather replaces the per-row dict lookup that
+    Series.map(dict) would do. Unknown asset IDs come back as NaN.
+
+    Args:
+        asset_ids: Array or Series of asset IDs
+        lut: (ids, prices) tuple returned by build_price_lut
+
+    Returns:
+        numpy.ndarray: float64 prices aligned with asset_ids (NaN where unknown)
+    """
+    ids, values = lut
+    asset_ids = np.asarray(asset_ids, dtype=np.int64)
+
+    if ids.size == 0:
+        return np.full(asset_ids.shape, np.nan)
+
+    idx = np.searchsorted(ids, asset_ids)
+    idx[idx == ids.size] = 0  # out-of-range IDs, caught by the equality check
+
+    prices = values[idx]
+    prices[ids[idx] != asset_ids] = np.nan
+    return prices
 
 
 def clear_price_cache():
     """Clears the price cache."""
-    _price_cache.clear()
+    _get_price_cache().clear()